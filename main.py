@@ -9,10 +9,12 @@ import argparse
 import csv
 import math
 import os
-import random
 import sys
+from collections import OrderedDict
+from functools import lru_cache
 import numpy as np
 from deap import base, creator, tools
+from numba import njit, prange
 
 # Local Imports
 import utility
@@ -29,10 +31,18 @@ GEN = 1000  # Number of generations
 CXR = 0.85  # Crossover rate
 MUT = 0.2   # Mutation rate
 TRN = 3     # Tournament size
+OPT = 50    # Generations between 2-opt passes on the best route
+INV = 0.825 # Chance a mutation actually inverts a segment
 
 # DEAP Setup
 creator.create("FitnessMin", base.Fitness, weights=(-1.0,))
-creator.create("Individual", list, fitness=creator.FitnessMin)
+creator.create("Individual", np.ndarray, fitness=creator.FitnessMin)
+
+# Individual backed by an int32 route array
+def as_individual(route):
+    ind = np.asarray(route, dtype=np.int32).view(creator.Individual)   # Copies unless route is already int32
+    ind.fitness = creator.FitnessMin()                                  # Views skip DEAP's __init__
+    return ind
 
 # Load Data
 def load_data(filepath):
@@ -54,72 +64,240 @@ def load_data(filepath):
     return cities, np.array(coords, dtype=np.float64)
 
 # Haversine Distance Calculator
+DEG_TO_RAD = math.pi / 180
+TWO_R = 2 * 3958.8  # 3958.8 is the earth's radius in miles
+
 def hav_dist(lat1, lon1, lat2, lon2):
-    rlat1, rlon1, rlat2, rlon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    rlat1 = lat1 * DEG_TO_RAD
+    rlat2 = lat2 * DEG_TO_RAD
 
     dlat = rlat2 - rlat1
-    dlon = rlon2 - rlon1
+    dlon = (lon2 - lon1) * DEG_TO_RAD
 
     a = math.sin(dlat / 2) ** 2 + math.cos(rlat1) * math.cos(rlat2) * math.sin(dlon / 2) ** 2
+    a = min(a, 1.0)     # Rounding can push near-antipodal pairs just past 1.0
 
-    dist = 2 * 3958.8 * math.asin(math.sqrt(a)) # 3958.8 is the earth's radius in miles
+    dist = TWO_R * math.atan2(math.sqrt(a), math.sqrt(1.0 - a))
 
     return dist
 
 # Distance Matrix Generator
 def distance_matrix(coords):
-    n = len (coords)
-    matrix = np.zeros((n, n), dtype=np.float64)
+    # Convert to radians once and broadcast pairwise differences
+    lat = np.radians(coords[:, 0])
+    lon = np.radians(coords[:, 1])
+
+    coslat = np.cos(lat)    # n cosines shared by rows and columns
+    sin_half_dlat = np.sin((lat[:, None] - lat[None, :]) / 2)
+    sin_half_dlon = np.sin((lon[:, None] - lon[None, :]) / 2)
+
+    a = sin_half_dlat ** 2 + np.outer(coslat, coslat) * sin_half_dlon ** 2
 
-    for i in range (n):
-        for j in range (i+1, n):
-            dist = hav_dist(coords[i, 0], coords[i, 1], coords[j, 0], coords[j, 1])
-            matrix[i, j] = dist
-            matrix[j, i] = dist
+    matrix = TWO_R * np.arcsin(np.sqrt(a))
+    np.fill_diagonal(matrix, 0.0)                # Guard against fp noise on the diagonal
 
     return matrix
 
+# Tour Length Kernel
+@njit(fastmath=True, cache=True)
+def tour_len(ind, D, n):
+    s = 0.0
+    for i in range(n - 1):
+        s += D[ind[i], ind[i + 1]]
+    s += D[ind[n - 1], ind[0]]  # Return to the starting city
+    return s
+
+# Packed Upper-Triangle Storage
+PACK_MIN = 1024     # Smallest tour whose matrix is stored as a packed upper triangle
+
+def pack_upper(matrix):
+    return np.ascontiguousarray(matrix[np.triu_indices(len(matrix), 1)])
+
+@njit(inline="always")
+def packed_dist(flat, i, j, n):
+    if i > j:
+        i, j = j, i
+    return flat[i * (2 * n - i - 1) // 2 + (j - i - 1)]    # Row offset plus column within the row
+
+@njit(fastmath=True, cache=True)
+def tour_len_packed(ind, flat, n):
+    s = 0.0
+    for i in range(n - 1):
+        s += packed_dist(flat, ind[i], ind[i + 1], n)
+    s += packed_dist(flat, ind[n - 1], ind[0], n)
+    return s
+
+# Dense Matrix Lookup
+@njit(inline="always")
+def dense_dist(D, i, j, n):
+    return D[i, j]
+
+# Runtime Kernel Specialization
+MAX_UNROLL = 8      # Largest tour that is fully unrolled, longer unrolled tours ran slower than the loop
+
+def specialize(n):
+    # Unroll every edge of the tour, the leading 0.0 keeps a float64 accumulator
+    if n <= MAX_UNROLL:
+        body = "0.0 + " + " + ".join(f"D[ind[{i}], ind[{(i + 1) % n}]]" for i in range(n))
+    elif n < PACK_MIN:
+        body = f"tour_len(ind, D, {n})"
+    else:
+        body = f"tour_len_packed(ind, D, {n})"     # D is the packed upper triangle
+    namespace = {"tour_len": tour_len, "tour_len_packed": tour_len_packed}
+    exec(f"def tour_len_n(ind, D):\n    return {body}\n", namespace)
+    tour_len_n = njit(fastmath=True)(namespace["tour_len_n"])
+
+    # Gather and reduce straight from the selected rows, no (M, n) temporaries
+    @njit(parallel=True, fastmath=True)
+    def eval_pop_n(P, rows, D, out):
+        for m in prange(rows.shape[0]):
+            out[m] = tour_len_n(P[rows[m]], D)
+
+    return tour_len_n, eval_pop_n
+
+# Ordered Crossover Kernels
+@njit(cache=True)
+def _ox_child(keep, fill, child, a, b):
+    n = keep.shape[0]
+    mark = np.zeros(n, np.bool_)    # Presence bitmap of cities already placed
+
+    for i in range(a, b):
+        child[i] = keep[i]
+        mark[keep[i]] = True
+
+    k = b
+    for i in range(n):
+        city = fill[(b + i) % n]    # Scan the other parent starting after the segment
+        if not mark[city]:
+            child[k % n] = city
+            k += 1
+
+@njit(cache=True)
+def cx_ordered(p1, p2, c1, c2, a, b):
+    _ox_child(p1, p2, c1, a, b)
+    _ox_child(p2, p1, c2, a, b)
+
+# In-place Inversion Kernel
+@njit(cache=True)
+def invert(a, b, ind):
+    while a < b:
+        ind[a], ind[b] = ind[b], ind[a]
+        a += 1
+        b -= 1
+
+# 2-opt Local Search Kernel
+@njit
+def two_opt(route, D, n, dist):
+    improved = True
+    while improved:
+        improved = False
+        for i in range(n - 1):
+            for j in range(i + 2, n):
+                a, b, c, d = route[i], route[i + 1], route[j], route[(j + 1) % n]
+                # Float64 sums of float32 edges are exact, so a move and its undo never both improve
+                added = float(dist(D, a, c, n)) + float(dist(D, b, d, n))
+                removed = float(dist(D, a, b, n)) + float(dist(D, c, d, n))
+                if added - removed < 0.0:
+                    invert(i + 1, j, route)     # Reverse the segment between the two edges
+                    improved = True
+
+# Random Cut Points
+def cut_points(rng, size, n):
+    a = rng.integers(0, n, size=size)
+    b = rng.integers(0, n - 1, size=size)
+    b += b >= a                             # Shift past a so each pair is distinct
+    return np.sort(np.stack((a, b), axis=1), axis=1)
+
 # Inversion Mutation
-def inversion_mutation(individual, indpb):
-    if random.random() < indpb:
-        size = len(individual)
-        a, b = sorted(random.sample(range(size), 2))    # Randomly pick two distinct positions
-        individual[a:b] = individual[a:b][::-1]         # Reverse the order within those positions
+def inversion_mutation(individual, a, b):
+    invert(a, b - 1, individual)            # Reverse the order within positions a..b-1, in place
     return (individual,)
 
-# Genetic Algorithm
-def run(distance, n_cities):
-    # Set Random Seed
-    random.seed(SEED)
-    np.random.seed(SEED)
+# Tournament Selection
+@lru_cache(maxsize=None)
+def _row_index(k):
+    return np.arange(k)
 
-    # Fitness Function
-    def evaluate(individual):
-        total = 0.0
+def tournament_select(fits, k, tournsize, rng):
+    samples = rng.integers(0, len(fits), size=(k, tournsize))          # All tournaments drawn at once
+    return samples[_row_index(k), np.argmin(fits[samples], axis=1)]     # Index of the shortest tour in each
 
-        for i in range (n_cities):
-            total += distance[individual[i], individual[(i+1) % n_cities]]
+# Canonical Tour Keys
+def tour_keys(P):
+    M, n = P.shape
+    start = np.argmax(P == 0, axis=1)                           # Rotate so each tour starts at city 0
+    R = P[np.arange(M)[:, None], (start[:, None] + np.arange(n)) % n]
+    flip = R[:, 1] > R[:, -1]
+    R[flip, 1:] = R[flip, :0:-1]                                # Reflected tours share the same key
+    return [row.tobytes() for row in R]
 
-        return (total,)
+# Genetic Algorithm
+def run(distance, n_cities):
+    # Set Random Seed
+    rng = np.random.default_rng(SEED)     # Single stream for every random draw
+
+    # Contiguous C-order matrix for cache-friendly gathers, float32 halves the bytes per gather
+    exact = np.ascontiguousarray(distance, dtype=np.float64)   # Kept for the reported distance
+    distance = np.ascontiguousarray(distance, dtype=np.float32)
+    dist = dense_dist
+    if n_cities >= PACK_MIN:
+        distance = pack_upper(distance)     # Symmetric, so only the upper triangle is kept
+        dist = packed_dist
+
+    # Kernels specialized on the fixed number of cities
+    tour_len_n, eval_pop_n = specialize(n_cities)
+
+    # Batch Fitness Function
+    out = np.empty(POP, dtype=np.float64)   # Reused across generations
+    cache = OrderedDict()                   # Tour key -> length, LRU bounded
+    cache_size = 10 * POP
+
+    def evaluate_all(P, fits, rows):
+        if len(rows) == 0:
+            return
+
+        keys = tour_keys(P[rows])
+
+        # Reuse cached lengths and only evaluate unseen tours
+        new, new_keys = [], []
+        for row, key in zip(rows, keys):
+            if key in cache:
+                cache.move_to_end(key)
+                fits[row] = cache[key]
+            else:
+                new.append(row)
+                new_keys.append(key)
+
+        M = len(new)
+        if M == 0:
+            return
+
+        new = np.asarray(new, dtype=np.intp)
+        eval_pop_n(P, new, distance, out[:M])
+        fits[new] = out[:M]
+
+        for key, fit in zip(new_keys, out[:M]):
+            cache[key] = float(fit)
+
+        while len(cache) > cache_size:
+            cache.popitem(last=False)
 
     # Setup DEAP Toolbox
     toolbox = base.Toolbox()
-    toolbox.register("indices", random.sample, range(n_cities), n_cities)
-    toolbox.register("individual", tools.initIterate, creator.Individual, toolbox.indices)
+    toolbox.register("indices", rng.permutation, n_cities)
+    toolbox.register("individual", lambda: as_individual(toolbox.indices()))
     toolbox.register("population", tools.initRepeat,  list, toolbox.individual)
-    toolbox.register("evaluate", evaluate)
-    toolbox.register("mate", tools.cxOrdered)
-    toolbox.register("mutate", inversion_mutation, indpb=0.825)  
-    toolbox.register("select", tools.selTournament, tournsize=TRN)
+    toolbox.register("mutate", inversion_mutation)
+    toolbox.register("select", tournament_select, tournsize=TRN, rng=rng)
 
-    best_route = tools.HallOfFame(1)    # Keep the single best individual route
-    pop = toolbox.population(n=POP)     # Initial Population
+    # Population held as a contiguous (POP, n_cities) route matrix
+    P = np.stack(toolbox.population(n=POP))
+    fits = np.empty(POP, dtype=np.float64)
 
     # Evaluate Initial Population Fitness
-    fitnesses = list(map(toolbox.evaluate, pop))
-    for ind, fit in zip(pop, fitnesses):
-        ind.fitness.values = fit
-    best_route.update(pop)
+    evaluate_all(P, fits, np.arange(POP))
+    best = int(np.argmin(fits))
+    best_tour, best_fit = P[best].copy(), fits[best]
 
     # Saved for Plotting
     best_per_gen = []
@@ -127,37 +305,58 @@ def run(distance, n_cities):
     # Evolution loop
     for gen in range (1, (GEN+1)):
         # Selection
-        offspring = toolbox.select(pop, len(pop))
-        offspring = list(map(toolbox.clone, offspring))
+        idx = toolbox.select(fits, POP)
+        P_sel = P[idx]
+        P_off = P_sel.copy()            # One contiguous copy instead of cloning every individual
+        fits_off = fits[idx]
+        valid = np.ones(POP, dtype=bool)
 
         # Crossover
-        for child1, child2 in zip(offspring[::2], offspring[1::2]):
-            if random.random() < CXR:
-                toolbox.mate(child1, child2)
-                del child1.fitness.values
-                del child2.fitness.values
+        do_cx = rng.random(POP // 2) < CXR
+        cx_cuts = cut_points(rng, POP // 2, n_cities)
+        for pair in np.flatnonzero(do_cx):
+            i = 2 * pair
+            a, b = cx_cuts[pair]                                    # Segment a..b inclusive
+            cx_ordered(P_sel[i], P_sel[i + 1], P_off[i], P_off[i + 1], a, b + 1)
+            valid[i] = valid[i + 1] = False
 
         # Mutation
-        for mutant in offspring:
-            if random.random() < MUT:
-                toolbox.mutate(mutant)
-                del mutant.fitness.values
+        do_inv = (rng.random(POP) < MUT) & (rng.random(POP) < INV)  # Mutated and actually inverted
+        mut_cuts = cut_points(rng, POP, n_cities)
+        for i in np.flatnonzero(do_inv):
+            toolbox.mutate(P_off[i], *mut_cuts[i])
+            valid[i] = False
 
         # Evaluation
-        invalid = [ind for ind in offspring if not ind.fitness.valid]
-        fitnesses = list(map(toolbox.evaluate, invalid))
-        for ind, fit in zip(invalid, fitnesses):
-            ind.fitness.values = fit
+        evaluate_all(P_off, fits_off, np.flatnonzero(~valid))
 
         # Keep Best Route
-        offspring[0] = toolbox.clone(best_route[0])
-        pop[:] = offspring
-        best_route.update(pop)
-
-        best_per_gen.append(best_route[0].fitness.values[0])
-
-    best_tour = list(best_route[0])
-    best_distance = best_route[0].fitness.values[0]
+        P_off[0] = best_tour
+        fits_off[0] = best_fit
+        P, fits = P_off, fits_off
+
+        best = int(np.argmin(fits))
+        if fits[best] < best_fit:
+            best_tour, best_fit = P[best].copy(), fits[best]
+
+        # Polish the best route with 2-opt
+        if gen % OPT == 0:
+            polished = best_tour.copy()
+            two_opt(polished, distance, n_cities, dist)
+            polished_fit = tour_len_n(polished, distance)
+            if polished_fit < best_fit:
+                best_tour, best_fit = polished, polished_fit
+
+        best_per_gen.append(float(best_fit))
+
+    # Hand the final best route back to DEAP for reporting
+    best_route = tools.HallOfFame(1, similar=np.array_equal)
+    best_ind = as_individual(best_tour)
+    best_ind.fitness.values = (float(best_fit),)
+    best_route.update([best_ind])
+
+    best_distance = float(tour_len(best_route[0], exact, n_cities))   # Full float64 edge lengths
+    best_tour = best_route[0].tolist()
     return best_tour, best_distance, best_per_gen
 
 def main():
@@ -1,19 +1,24 @@
 """This file contains the logging and plotting functions"""
 
 # Standard libraries or third-party packages
+import atexit
 import os
 import csv
 import matplotlib
 import matplotlib.pyplot as plt
 
 LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "log.txt")
-log_file = open(LOG_PATH, "w")
+log_file = None    # Opened on the first log call
 
 # Logging function
 def log(message):
+    global log_file
+    if log_file is None:
+        log_file = open(LOG_PATH, "w")
+        atexit.register(log_file.close)     # Flushes the buffered writes once at exit
+
     print(message, end="")
     log_file.write(message)
-    log_file.flush()
 
 # Save final results to csv
 def save_tour_csv(tour, cities, distance, filename = "best_tour.csv"):